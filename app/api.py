@@ -3,13 +3,30 @@ FastAPI Application for M5 Forecasting Model
 Serves predictions via REST API endpoints
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from collections import OrderedDict
+import asyncio
+import os
+
+# Worker processes when run via `python api.py`. Each worker loads its own
+# copy of the model and data, so the cores are split between them: the
+# booster, the compiled model and numba all get WORKER_THREADS threads.
+# numba sizes its thread pool from NUMBA_NUM_THREADS at import time, so this
+# is set before numba is imported.
+API_WORKERS = int(os.environ.get('API_WORKERS', 1))
+WORKER_THREADS = max(1, (os.cpu_count() or 1) // API_WORKERS)
+os.environ.setdefault('NUMBA_NUM_THREADS', str(WORKER_THREADS))
+
 import pandas as pd
 import numpy as np
+import xgboost as xgb
+from numba import njit
 import pickle
+import orjson
 import logging
 from datetime import datetime, timedelta
 
@@ -21,7 +38,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="M5 Forecasting API",
     description="XGBoost-based sales forecasting for Walmart products",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -33,11 +51,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+MODEL_PATH = '../m5_xgboost_model.pkl'
+COMPILED_MODEL_PATH = '../m5_xgboost_model.so'
+
 # Global variables for model and data
 model = None
+booster = None
+predictor = None
 calendar_df = None
 prices_df = None
 sales_df = None
+sales_row_idx = None
+sales_values_np = None
+calendar_features = None
+calendar_dates_iso = None
+label_maps = None
+forecast_inputs = None
+products_json = None
+stores_json = None
+
+# Forecasts keyed by (item_id, store_id, forecast_days). The model and the
+# history never change while the process runs, so results never go stale.
+PREDICTION_CACHE_SIZE = 1024
+prediction_cache = OrderedDict()
+
+DAY_COLS = [f'd_{i}' for i in range(1, 1914)]
+
+# Feature layout expected by the trained model
+CATEGORICAL_COLS = ['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
+LAG_DAYS = [7, 14, 28]
+ROLLING_WINDOWS = [7, 14, 28]
+# Days of history the lag and rolling features look back over
+HISTORY_TAIL = max(LAG_DAYS + ROLLING_WINDOWS)
+MAX_FORECAST_DAYS = 56
+FEATURE_COLS = CATEGORICAL_COLS + [
+    'day_of_week', 'day_of_month', 'week_of_year', 'month', 'year',
+    'has_event_1', 'has_event_2',
+    'snap_CA', 'snap_TX', 'snap_WI',
+    'sell_price', 'price_change'
+] + [f'lag_{lag}' for lag in LAG_DAYS] + \
+    [f'rolling_mean_{w}' for w in ROLLING_WINDOWS] + \
+    [f'rolling_std_{w}' for w in ROLLING_WINDOWS]
+DATE_FEATURES = ['day_of_week', 'day_of_month', 'week_of_year', 'month', 'year']
+EVENT_FEATURES = ['has_event_1', 'has_event_2', 'snap_CA', 'snap_TX', 'snap_WI']
+CALENDAR_FEATURES = DATE_FEATURES + EVENT_FEATURES
+FEATURE_INDEX = {col: i for i, col in enumerate(FEATURE_COLS)}
+CALENDAR_IDX = np.array([FEATURE_INDEX[col] for col in CALENDAR_FEATURES], dtype=np.int64)
+ROLLING_WINDOWS_ARR = np.array(ROLLING_WINDOWS, dtype=np.int64)
+ROLLING_MEAN_IDX = np.array([FEATURE_INDEX[f'rolling_mean_{w}'] for w in ROLLING_WINDOWS], dtype=np.int64)
+ROLLING_STD_IDX = np.array([FEATURE_INDEX[f'rolling_std_{w}'] for w in ROLLING_WINDOWS], dtype=np.int64)
 
 # ============================================================================
 # Pydantic Models
@@ -47,7 +109,7 @@ class PredictionRequest(BaseModel):
     """Request model for single prediction"""
     item_id: str = Field(..., example="HOBBIES_1_001")
     store_id: str = Field(..., example="CA_1")
-    forecast_days: int = Field(default=28, ge=1, le=56, description="Number of days to forecast")
+    forecast_days: int = Field(default=28, ge=1, le=MAX_FORECAST_DAYS, description="Number of days to forecast")
 
 class PredictionResponse(BaseModel):
     """Response model for predictions"""
@@ -71,21 +133,55 @@ class HealthResponse(BaseModel):
 @app.on_event("startup")
 async def load_model_and_data():
     """Load model and data on startup"""
-    global model, calendar_df, prices_df, sales_df
+    global model, booster, predictor, calendar_df, prices_df, sales_df, sales_row_idx, sales_values_np
+    global calendar_features, calendar_dates_iso, label_maps, forecast_inputs, products_json, stores_json
     
     try:
         logger.info("Loading model...")
-        with open('../m5_xgboost_model.pkl', 'rb') as f:
+        with open(MODEL_PATH, 'rb') as f:
             model = pickle.load(f)
+        # Predict through the raw booster to skip the sklearn wrapper and
+        # pandas -> DMatrix conversion on every forecast step (the training
+        # script saves a Booster; older pickles hold an XGBRegressor)
+        booster = model if isinstance(model, xgb.Booster) else model.get_booster()
+        booster.set_param({'nthread': WORKER_THREADS})
+        predictor = build_predictor(booster, WORKER_THREADS)
         logger.info("✓ Model loaded successfully")
         
+        logger.info("Compiling feature kernels...")
+        warmup_kernels()
+        
         logger.info("Loading data...")
-        calendar_df = pd.read_csv('../calendar.csv')
-        prices_df = pd.read_csv('../sell_prices.csv')
-        sales_df = pd.read_csv('../sales_train_validation.csv')
+        calendar_df = load_table('calendar')
+        prices_df = load_table('sell_prices')
+        sales_df = load_table('sales_train_validation')
+        
+        # Map product-store to row position so lookups avoid a full boolean scan
+        sales_row_idx = dict(zip(
+            zip(sales_df['item_id'], sales_df['store_id']),
+            range(len(sales_df))
+        ))
+        sales_values_np = sales_df[DAY_COLS].to_numpy(dtype=np.int16)
+        
+        # Fixed label encoding, so codes don't depend on which rows are featurized
+        label_maps = {
+            col: {value: i for i, value in enumerate(sorted(sales_df[col].unique()))}
+            for col in CATEGORICAL_COLS
+        }
+        
+        # Product and store lists never change, so serialize them once
+        # (first 100 item_ids for demo)
+        products_json = orjson.dumps(sorted(sales_df['item_id'].unique()[:100].tolist()))
+        stores_json = orjson.dumps(sorted(sales_df['store_id'].unique().tolist()))
         
         # Convert date column
         calendar_df['date'] = pd.to_datetime(calendar_df['date'])
+        calendar_features = build_calendar_features(calendar_df)
+        
+        # ISO date strings in day order, so calendar_dates_iso[i - 1] is d_i
+        day_order = np.argsort(calendar_df['d'].str.slice(2).astype(int).to_numpy())
+        calendar_dates_iso = calendar_df['date'].dt.strftime('%Y-%m-%d').iloc[day_order].tolist()
+        forecast_inputs = build_forecast_inputs(calendar_df, prices_df, sales_df)
         
         logger.info("✓ Data loaded successfully")
         logger.info(f"  Sales shape: {sales_df.shape}")
@@ -96,51 +192,378 @@ async def load_model_and_data():
         logger.error(f"Error loading model/data: {e}")
         raise
 
-def create_features(df):
-    """Create features for the model"""
-    
-    # Time-based features
-    df['day_of_week'] = df['wday']
-    df['day_of_month'] = df['date'].dt.day
-    df['week_of_year'] = df['date'].dt.isocalendar().week
-    df['month'] = df['month'].astype(np.int8)
-    df['year'] = df['year'].astype(np.int16)
-    
-    # Event features
-    df['has_event_1'] = (df['event_name_1'].notna()).astype(np.int8)
-    df['has_event_2'] = (df['event_name_2'].notna()).astype(np.int8)
-    
-    # SNAP features
-    df['snap_CA'] = df['snap_CA'].astype(np.int8)
-    df['snap_TX'] = df['snap_TX'].astype(np.int8)
-    df['snap_WI'] = df['snap_WI'].astype(np.int8)
-    
-    # Price features
-    df['sell_price'] = df['sell_price'].fillna(0)
-    df['price_change'] = df.groupby('id')['sell_price'].transform(lambda x: x.diff())
-    df['price_change'] = df['price_change'].fillna(0)
-    
-    # Lag features
-    for lag in [7, 14, 28]:
-        df[f'lag_{lag}'] = df.groupby('id')['sales'].shift(lag)
-    
-    # Rolling features
-    for window in [7, 14, 28]:
-        df[f'rolling_mean_{window}'] = (
-            df.groupby('id')['sales']
-            .transform(lambda x: x.shift(1).rolling(window).mean())
+def build_predictor(booster, n_threads):
+    """Return a function that scores a float32 feature matrix
+    
+    When treelite and tl2cgen are installed the tree ensemble is compiled to
+    a shared library (rebuilt only when the model file is newer), which
+    predicts small batches much faster than the booster. Otherwise this
+    falls back to `booster.inplace_predict`, which still skips DMatrix
+    construction.
+    """
+    try:
+        import treelite
+        import tl2cgen
+    except ImportError:
+        logger.info("  treelite/tl2cgen not installed, predicting with the XGBoost booster")
+        return booster.inplace_predict
+    
+    try:
+        libpath = os.path.abspath(COMPILED_MODEL_PATH)
+        if not os.path.exists(libpath) or os.path.getmtime(libpath) < os.path.getmtime(MODEL_PATH):
+            logger.info("  Compiling model with treelite...")
+            # With API_WORKERS > 1 every worker may compile at once, so each
+            # builds its own file and atomically swaps it in; no worker can
+            # load a library another is still writing
+            tmp_libpath = f'{os.path.splitext(libpath)[0]}.{os.getpid()}.tmp.so'
+            try:
+                tl2cgen.export_lib(
+                    treelite.frontend.from_xgboost(booster),
+                    toolchain='gcc',
+                    libpath=tmp_libpath,
+                    params={'parallel_comp': n_threads}
+                )
+                os.replace(tmp_libpath, libpath)
+            finally:
+                if os.path.exists(tmp_libpath):
+                    os.remove(tmp_libpath)
+        compiled = tl2cgen.Predictor(libpath, nthread=n_threads)
+    except Exception as e:
+        logger.warning(f"  Could not compile model with treelite ({e}), predicting with the XGBoost booster")
+        return booster.inplace_predict
+    
+    def predict(X):
+        return compiled.predict(tl2cgen.DMatrix(X)).reshape(-1)
+    
+    logger.info(f"  Using compiled model {libpath}")
+    return predict
+
+def load_table(name):
+    """Load a dataset, preferring the Parquet copy from convert_to_parquet.py"""
+    parquet_path = f'../{name}.parquet'
+    if os.path.exists(parquet_path):
+        return pd.read_parquet(parquet_path, engine='pyarrow')
+    
+    logger.info(f"  {parquet_path} not found, reading CSV (run convert_to_parquet.py to speed up startup)")
+    return pd.read_csv(f'../{name}.csv')
+
+def get_product_index(item_id, store_id):
+    """Return the sales_df row position of a product-store combination"""
+    idx = sales_row_idx.get((item_id, store_id))
+    if idx is None:
+        raise HTTPException(
+            status_code=404, 
+            detail=f"Product {item_id} not found in store {store_id}"
         )
-        df[f'rolling_std_{window}'] = (
-            df.groupby('id')['sales']
-            .transform(lambda x: x.shift(1).rolling(window).std())
+    return idx
+
+def build_forecast_inputs(calendar, prices, sales):
+    """Precompute the per-product inputs of the recursive forecast
+    
+    The history never changes, so the values the forecast needs from the
+    melted and merged history (last date, last day's flags and last known
+    prices) are gathered once for all products instead of melting and
+    merging a product on every /predict. Prices over the forecast horizon
+    are joined onto sales_df's rows, so a product's prices are read by its
+    row position.
+    """
+    last_day = calendar[calendar['d'] == DAY_COLS[-1]].iloc[0]
+    
+    # Weeks of the last history day and of every possible forecast day
+    week_of_day = calendar.set_index('d')['wm_yr_wk']
+    weeks = [
+        week_of_day.get(f'd_{len(DAY_COLS) + k}')
+        for k in range(MAX_FORECAST_DAYS + 1)
+    ]
+    
+    week_prices = prices[prices['wm_yr_wk'].isin([w for w in weeks if w is not None])]
+    week_prices = week_prices.set_index([
+        week_prices['item_id'].astype(str),
+        week_prices['store_id'].astype(str),
+        'wm_yr_wk'
+    ])['sell_price'].unstack('wm_yr_wk')
+    product_keys = pd.MultiIndex.from_arrays([
+        sales['item_id'].astype(str),
+        sales['store_id'].astype(str)
+    ])
+    week_prices = week_prices.reindex(product_keys)
+    
+    # Column k is the price on day k of the forecast (0 = last history day).
+    # Days without a known price carry the previous price forward.
+    daily_prices = pd.DataFrame({
+        k: week_prices[w].to_numpy() if w is not None and w in week_prices.columns else np.nan
+        for k, w in enumerate(weeks)
+    })
+    daily_prices = daily_prices.ffill(axis=1).fillna(0)
+    
+    return {
+        'last_date': last_day['date'],
+        # Event/SNAP flags of the last known day, for dates beyond the calendar
+        'last_flags': {
+            'has_event_1': int(pd.notna(last_day['event_name_1'])),
+            'has_event_2': int(pd.notna(last_day['event_name_2'])),
+            'snap_CA': int(last_day['snap_CA']),
+            'snap_TX': int(last_day['snap_TX']),
+            'snap_WI': int(last_day['snap_WI']),
+        },
+        # Aligned with sales_df rows; 0 where the product had no price yet
+        'prices': daily_prices.to_numpy(dtype=np.float32),
+    }
+
+def build_calendar_features(calendar):
+    """Precompute the calendar features of every day, in d_1, d_2, ... order
+    
+    Row i - 1 holds CALENDAR_FEATURES for d_i, so forecast steps copy a
+    ready-made row instead of deriving date parts per step.
+    """
+    calendar = calendar.iloc[np.argsort(calendar['d'].str.slice(2).astype(int).to_numpy())]
+    features = pd.DataFrame({
+        'day_of_week': calendar['wday'],
+        'day_of_month': calendar['date'].dt.day,
+        'week_of_year': calendar['date'].dt.isocalendar().week.astype(np.int16),
+        'month': calendar['month'],
+        'year': calendar['year'],
+        'has_event_1': calendar['event_name_1'].notna(),
+        'has_event_2': calendar['event_name_2'].notna(),
+        'snap_CA': calendar['snap_CA'],
+        'snap_TX': calendar['snap_TX'],
+        'snap_WI': calendar['snap_WI'],
+    })
+    return features[CALENDAR_FEATURES].to_numpy(dtype=np.float32)
+
+def extrapolate_calendar_features(forecast_date):
+    """Calendar features for a date beyond the end of the calendar
+    
+    Date parts come from the date itself; event/SNAP flags repeat those of
+    the last known day.
+    """
+    flags = forecast_inputs['last_flags']
+    return np.array([
+        # M5 wday numbering (Saturday = 1), as used in training
+        (forecast_date.dayofweek + 2) % 7 + 1,
+        forecast_date.day,
+        forecast_date.isocalendar()[1],
+        forecast_date.month,
+        forecast_date.year,
+    ] + [flags[col] for col in EVENT_FEATURES], dtype=np.float32)
+
+@njit(cache=True)
+def rolling_mean_tail(a, w):
+    """Mean of the last `w` values of `a`"""
+    total = 0.0
+    for i in range(len(a) - w, len(a)):
+        total += a[i]
+    return total / w
+
+@njit(cache=True)
+def rolling_std_tail(a, w):
+    """Sample standard deviation (ddof=1) of the last `w` values of `a`"""
+    mean = rolling_mean_tail(a, w)
+    sq_total = 0.0
+    for i in range(len(a) - w, len(a)):
+        diff = a[i] - mean
+        sq_total += diff * diff
+    return np.sqrt(sq_total / (w - 1))
+
+@njit(cache=True)
+def rolling_tail_stats(sales, windows, mean_cols, std_cols, out):
+    """Write the rolling mean/std of each history row into `out`
+    
+    Serial: a batch is at most 32 rows of 3 short windows, less work than a
+    thread-pool dispatch on every forecast step would cost.
+    """
+    for row in range(sales.shape[0]):
+        for j in range(len(windows)):
+            out[row, mean_cols[j]] = rolling_mean_tail(sales[row], windows[j])
+            out[row, std_cols[j]] = rolling_std_tail(sales[row], windows[j])
+
+def warmup_kernels():
+    """Compile the numba kernels so the first request pays no JIT cost"""
+    # Same array layouts as forecast_batch passes in: a one-row slice of the
+    # history buffer is C-contiguous (numpy ignores strides of size-1
+    # dimensions), while a multi-row slice is not, so both are compiled
+    out = np.zeros((3, len(FEATURE_COLS)), dtype=np.float32)
+    for n_rows in (1, 2):
+        history = np.zeros((3, 2 * max(ROLLING_WINDOWS)), dtype=np.float32)[:n_rows, :max(ROLLING_WINDOWS)]
+        rolling_tail_stats(history, ROLLING_WINDOWS_ARR, ROLLING_MEAN_IDX, ROLLING_STD_IDX, out[:n_rows])
+
+def compute_next_features(sales, calendar_row, sell_price, price_change, static_codes, out):
+    """Compute the feature rows for the day following each history in `sales`
+    
+    Equivalent to featurizing each history plus one new row, but only reads
+    the tail of the sales arrays instead of re-featurizing the whole
+    history. `sales` is a (batch, days) float32 array and features are
+    written into `out`, a float32 (batch, FEATURE_COLS) buffer the caller
+    reuses across forecast steps.
+    """
+    for j, col in enumerate(CATEGORICAL_COLS):
+        out[:, FEATURE_INDEX[col]] = static_codes[:, j]
+    out[:, CALENDAR_IDX] = calendar_row
+    
+    out[:, FEATURE_INDEX['sell_price']] = sell_price
+    out[:, FEATURE_INDEX['price_change']] = price_change
+    
+    for lag in LAG_DAYS:
+        out[:, FEATURE_INDEX[f'lag_{lag}']] = sales[:, -lag]
+    
+    # Rolling stats over the `window` days preceding the forecast day
+    rolling_tail_stats(sales, ROLLING_WINDOWS_ARR, ROLLING_MEAN_IDX, ROLLING_STD_IDX, out)
+    
+    return out
+
+def prepare_forecast_state(item_id, store_id):
+    """Build the recursive forecasting state for a product-store combination
+    
+    Only the last HISTORY_TAIL days of sales and the static per-product
+    values are needed to featurize each forecast day, so that is all the
+    state keeps.
+    """
+    idx = get_product_index(item_id, store_id)
+    
+    return {
+        'sales': sales_values_np[idx, -HISTORY_TAIL:],
+        'sell_prices': forecast_inputs['prices'][idx],
+        'static_codes': [
+            label_maps[col][sales_df[col].iat[idx]] for col in CATEGORICAL_COLS
+        ],
+    }
+
+def forecast_batch(tasks):
+    """Run recursive forecasts for several products in lockstep
+    
+    `tasks` is a list of (state, forecast_days) pairs. All products advance
+    one day at a time and each step stacks one feature row per product still
+    being forecast, so the booster scores the whole batch in a single call.
+    Returns a (predictions, dates) pair per task.
+    """
+    # Longest horizons first, so the products still being forecast at any
+    # step are always the leading rows of the batch
+    order = sorted(range(len(tasks)), key=lambda i: tasks[i][1], reverse=True)
+    states = [tasks[i][0] for i in order]
+    days = [tasks[i][1] for i in order]
+    horizon = days[0]
+    
+    # Last HISTORY_TAIL days plus room for every forecast day, filled in place
+    history = np.empty((len(states), HISTORY_TAIL + horizon), dtype=np.float32)
+    for row, state in enumerate(states):
+        history[row, :HISTORY_TAIL] = state['sales']
+    sell_prices = np.array([state['sell_prices'] for state in states], dtype=np.float32)
+    static_codes = np.array([state['static_codes'] for state in states], dtype=np.float32)
+    
+    # Feature matrix reused across all forecast steps
+    X_buf = np.empty((len(states), len(FEATURE_COLS)), dtype=np.float32)
+    
+    last_date = forecast_inputs['last_date']
+    forecast_dates = []
+    
+    for day_ahead in range(1, horizon + 1):
+        n_active = sum(d >= day_ahead for d in days)
+        n_filled = HISTORY_TAIL + day_ahead - 1
+        day_idx = len(DAY_COLS) + day_ahead - 1
+        
+        if day_idx < len(calendar_features):
+            forecast_dates.append(calendar_dates_iso[day_idx])
+            calendar_row = calendar_features[day_idx]
+        else:
+            forecast_date = last_date + timedelta(days=day_ahead)
+            forecast_dates.append(forecast_date.strftime('%Y-%m-%d'))
+            calendar_row = extrapolate_calendar_features(forecast_date)
+        
+        compute_next_features(
+            history[:n_active, :n_filled], calendar_row,
+            sell_prices[:n_active, day_ahead],
+            sell_prices[:n_active, day_ahead] - sell_prices[:n_active, day_ahead - 1],
+            static_codes[:n_active], X_buf[:n_active]
         )
+        
+        # Predict, ensuring non-negative sales, and feed the predictions
+        # back into the histories for the next day
+        preds = predictor(X_buf[:n_active])
+        history[:n_active, n_filled] = np.maximum(preds, 0)
     
-    # Encode categorical variables
-    categorical_cols = ['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
-    for col in categorical_cols:
-        df[col] = df[col].astype('category').cat.codes
+    results = [None] * len(tasks)
+    for row, i in enumerate(order):
+        results[i] = (
+            history[row, HISTORY_TAIL:HISTORY_TAIL + days[row]].tolist(),
+            forecast_dates[:days[row]]
+        )
+    return results
+
+class DynamicBatcher:
+    """Queue incoming tasks and process them in batches
     
-    return df
+    A batch is flushed to `infer` once `max_batch_size` tasks are waiting or
+    the oldest one has waited `max_delay` seconds. `infer` runs in the default
+    executor so the event loop keeps accepting requests meanwhile.
+    """
+    
+    def __init__(self, infer, max_batch_size=32, max_delay=0.05):
+        self.infer = infer
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._queue = None
+        self._worker = None
+    
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+    
+    async def process_batched(self, task):
+        """Submit a task and wait for its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((task, future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            try:
+                results = await loop.run_in_executor(
+                    None, self.infer, [task for task, _ in batch]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+forecast_batcher = DynamicBatcher(forecast_batch, max_batch_size=32, max_delay=0.05)
+
+@app.on_event("startup")
+async def start_forecast_batcher():
+    """Start the background worker that batches /predict requests"""
+    forecast_batcher.start()
+
+@app.on_event("shutdown")
+async def stop_forecast_batcher():
+    """Stop the /predict batching worker"""
+    await forecast_batcher.stop()
 
 # ============================================================================
 # API Endpoints
@@ -173,21 +596,18 @@ async def health_check():
 @app.get("/products", response_model=List[str])
 async def get_products():
     """Get list of available products"""
-    if sales_df is None:
+    if products_json is None:
         raise HTTPException(status_code=503, detail="Data not loaded")
     
-    # Get unique item_ids (first 100 for demo)
-    items = sorted(sales_df['item_id'].unique()[:100].tolist())
-    return items
+    return Response(content=products_json, media_type="application/json")
 
 @app.get("/stores", response_model=List[str])
 async def get_stores():
     """Get list of available stores"""
-    if sales_df is None:
+    if stores_json is None:
         raise HTTPException(status_code=503, detail="Data not loaded")
     
-    stores = sorted(sales_df['store_id'].unique().tolist())
-    return stores
+    return Response(content=stores_json, media_type="application/json")
 
 @app.post("/predict", response_model=PredictionResponse)
 async def predict(request: PredictionRequest):
@@ -197,97 +617,23 @@ async def predict(request: PredictionRequest):
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
-        # Get product info
-        product_key = f"{request.item_id}_{request.store_id}"
-        product_data = sales_df[
-            (sales_df['item_id'] == request.item_id) & 
-            (sales_df['store_id'] == request.store_id)
-        ]
+        cache_key = (request.item_id, request.store_id, request.forecast_days)
+        cached = prediction_cache.get(cache_key)
         
-        if product_data.empty:
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Product {request.item_id} not found in store {request.store_id}"
+        if cached is None:
+            state = prepare_forecast_state(request.item_id, request.store_id)
+            
+            # Concurrent requests are forecast together in one batch
+            cached = await forecast_batcher.process_batched(
+                (state, request.forecast_days)
             )
+            prediction_cache[cache_key] = cached
+            if len(prediction_cache) > PREDICTION_CACHE_SIZE:
+                prediction_cache.popitem(last=False)
+        else:
+            prediction_cache.move_to_end(cache_key)
         
-        # Prepare historical data
-        id_cols = ['id', 'item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
-        day_cols = [f'd_{i}' for i in range(1, 1914)]
-        
-        # Melt to long format
-        sales_long = product_data.melt(
-            id_vars=id_cols,
-            value_vars=day_cols,
-            var_name='d',
-            value_name='sales'
-        )
-        
-        # Merge with calendar and prices
-        sales_long = sales_long.merge(calendar_df, on='d', how='left')
-        sales_long = sales_long.merge(
-            prices_df, 
-            on=['store_id', 'item_id', 'wm_yr_wk'], 
-            how='left'
-        )
-        
-        sales_long = sales_long.sort_values('date').reset_index(drop=True)
-        
-        # Recursive forecasting
-        predictions = []
-        forecast_dates = []
-        
-        # Get future calendar
-        last_date = sales_long['date'].max()
-        
-        for day_ahead in range(1, request.forecast_days + 1):
-            forecast_date = last_date + timedelta(days=day_ahead)
-            forecast_dates.append(forecast_date.strftime('%Y-%m-%d'))
-            
-            # Get last row
-            last_row = sales_long.tail(1).copy()
-            
-            # Update date info
-            last_row['date'] = forecast_date
-            last_row['d'] = f'd_{1913 + day_ahead}'
-            
-            # Simple date features (since we may not have future calendar)
-            last_row['wday'] = forecast_date.dayofweek + 1
-            last_row['weekday'] = forecast_date.strftime('%A')
-            last_row['month'] = forecast_date.month
-            last_row['year'] = forecast_date.year
-            last_row['day_of_week'] = last_row['wday']
-            last_row['day_of_month'] = forecast_date.day
-            last_row['week_of_year'] = forecast_date.isocalendar()[1]
-            
-            # Create features
-            temp_df = pd.concat([sales_long, last_row], ignore_index=True)
-            temp_df = create_features(temp_df)
-            
-            # Get prediction row
-            pred_row = temp_df.tail(1)
-            
-            # Define feature columns
-            feature_cols = [
-                'item_id', 'dept_id', 'cat_id', 'store_id', 'state_id',
-                'day_of_week', 'day_of_month', 'week_of_year', 'month', 'year',
-                'has_event_1', 'has_event_2',
-                'snap_CA', 'snap_TX', 'snap_WI',
-                'sell_price', 'price_change',
-                'lag_7', 'lag_14', 'lag_28',
-                'rolling_mean_7', 'rolling_mean_14', 'rolling_mean_28',
-                'rolling_std_7', 'rolling_std_14', 'rolling_std_28'
-            ]
-            
-            X_pred = pred_row[feature_cols].fillna(0)
-            
-            # Predict
-            pred = model.predict(X_pred)[0]
-            pred = max(0, pred)  # Ensure non-negative
-            predictions.append(float(pred))
-            
-            # Update sales_long with prediction
-            last_row['sales'] = pred
-            sales_long = pd.concat([sales_long, last_row], ignore_index=True)
+        predictions, forecast_dates = cached
         
         return PredictionResponse(
             item_id=request.item_id,
@@ -311,23 +657,14 @@ async def get_historical_data(item_id: str, store_id: str, days: int = 90):
         raise HTTPException(status_code=503, detail="Data not loaded")
     
     try:
-        product_data = sales_df[
-            (sales_df['item_id'] == item_id) & 
-            (sales_df['store_id'] == store_id)
-        ]
-        
-        if product_data.empty:
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Product {item_id} not found in store {store_id}"
-            )
+        idx = get_product_index(item_id, store_id)
         
         # Get last N days
-        day_cols = [f'd_{i}' for i in range(max(1, 1913-days), 1914)]
-        sales_values = product_data[day_cols].values[0].tolist()
+        start_day = max(1, 1913-days)
+        sales_values = sales_values_np[idx, start_day-1:].tolist()
         
         # Get corresponding dates
-        dates = calendar_df[calendar_df['d'].isin(day_cols)]['date'].dt.strftime('%Y-%m-%d').tolist()
+        dates = calendar_dates_iso[start_day-1:len(DAY_COLS)]
         
         return {
             "item_id": item_id,
@@ -344,4 +681,4 @@ async def get_historical_data(item_id: str, store_id: str, days: int = 90):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run("api:app", host="0.0.0.0", port=8000, workers=API_WORKERS)
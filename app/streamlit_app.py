@@ -4,7 +4,11 @@ Interactive interface for sales predictions
 """
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import requests
+from requests.adapters import HTTPAdapter
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
@@ -17,6 +21,13 @@ import time
 
 API_URL = "http://localhost:8000"
 
+# Keep-alive connection pool reused by every API call
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+# Connect timeout (seconds) so an offline API fails fast
+CONNECT_TIMEOUT = 2
+
 st.set_page_config(
     page_title="M5 Sales Forecasting",
     page_icon="📊",
@@ -31,35 +42,42 @@ st.set_page_config(
 def check_api_health():
     """Check if API is available"""
     try:
-        response = requests.get(f"{API_URL}/health", timeout=2)
+        response = SESSION.get(f"{API_URL}/health", timeout=2)
         return response.status_code == 200
     except:
         return False
 
+@st.cache_data(ttl=3600)
+def fetch_list(endpoint):
+    """Fetch a JSON list from the API, cached across reruns
+    
+    Raises on failure so that errors are not cached.
+    """
+    response = SESSION.get(f"{API_URL}/{endpoint}", timeout=(CONNECT_TIMEOUT, None))
+    response.raise_for_status()
+    return response.json()
+
 def get_products():
     """Fetch available products from API"""
     try:
-        response = requests.get(f"{API_URL}/products")
-        if response.status_code == 200:
-            return response.json()
-        return []
+        return fetch_list("products")
     except:
         return []
 
 def get_stores():
     """Fetch available stores from API"""
     try:
-        response = requests.get(f"{API_URL}/stores")
-        if response.status_code == 200:
-            return response.json()
-        return []
+        return fetch_list("stores")
     except:
         return []
 
 def get_historical_data(item_id, store_id, days=90):
     """Fetch historical sales data"""
     try:
-        response = requests.get(f"{API_URL}/historical/{item_id}/{store_id}?days={days}")
+        response = SESSION.get(
+            f"{API_URL}/historical/{item_id}/{store_id}?days={days}",
+            timeout=(CONNECT_TIMEOUT, None)
+        )
         if response.status_code == 200:
             return response.json()
         return None
@@ -74,7 +92,7 @@ def get_prediction(item_id, store_id, forecast_days):
             "store_id": store_id,
             "forecast_days": forecast_days
         }
-        response = requests.post(f"{API_URL}/predict", json=payload)
+        response = SESSION.post(f"{API_URL}/predict", json=payload, timeout=(CONNECT_TIMEOUT, None))
         if response.status_code == 200:
             return response.json()
         return None
@@ -321,19 +339,26 @@ def main():
     # Main content
     if config['predict_button']:
         with st.spinner("🔮 Generating forecast..."):
-            # Get historical data
-            historical_data = get_historical_data(
-                config['item_id'], 
-                config['store_id'], 
-                config['historical_days']
-            )
-            
-            # Get forecast
-            forecast_data = get_prediction(
-                config['item_id'],
-                config['store_id'],
-                config['forecast_days']
-            )
+            # Fetch historical data and forecast concurrently
+            ctx = get_script_run_ctx()
+            with ThreadPoolExecutor(
+                max_workers=2,
+                initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+            ) as executor:
+                historical_future = executor.submit(
+                    get_historical_data,
+                    config['item_id'], 
+                    config['store_id'], 
+                    config['historical_days']
+                )
+                forecast_future = executor.submit(
+                    get_prediction,
+                    config['item_id'],
+                    config['store_id'],
+                    config['forecast_days']
+                )
+                historical_data = historical_future.result()
+                forecast_data = forecast_future.result()
             
             if forecast_data:
                 st.success(f"✅ Forecast generated successfully!")
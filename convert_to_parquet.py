@@ -0,0 +1,58 @@
+"""
+M5 Forecasting - Convert Datasets to Parquet
+One-time preprocessing that stores the CSV datasets as Parquet with explicit
+dtypes, so the API can load them without CSV parsing or dtype inference.
+"""
+
+import pandas as pd
+import numpy as np
+
+print("="*60)
+print("M5 FORECASTING - PARQUET CONVERSION")
+print("="*60)
+
+day_cols = [f'd_{i}' for i in range(1, 1914)]
+
+# Repeated strings are stored as categoricals (dictionary encoded)
+sales_dtypes = {col: 'category' for col in ['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']}
+# Daily unit sales fit comfortably in int16
+sales_dtypes.update({col: np.int16 for col in day_cols})
+
+calendar_dtypes = {
+    'weekday': 'category',
+    'event_name_1': 'category',
+    'event_type_1': 'category',
+    'event_name_2': 'category',
+    'event_type_2': 'category',
+    'snap_CA': np.int8,
+    'snap_TX': np.int8,
+    'snap_WI': np.int8,
+}
+
+prices_dtypes = {
+    'store_id': 'category',
+    'item_id': 'category',
+    'sell_price': np.float32,
+}
+
+datasets = [
+    ('sales_train_validation', sales_dtypes),
+    ('calendar', calendar_dtypes),
+    ('sell_prices', prices_dtypes),
+]
+
+for name, dtypes in datasets:
+    print(f"\nConverting {name}.csv...")
+    df = pd.read_csv(f'{name}.csv', dtype=dtypes)
+
+    if name == 'calendar':
+        df['date'] = pd.to_datetime(df['date'])
+
+    df.to_parquet(f'{name}.parquet', engine='pyarrow', compression='zstd', index=False)
+    print(f"  Shape: {df.shape}")
+    print(f"  Memory: {df.memory_usage(deep=True).sum() / 1024**2:.1f} MB")
+    print(f"✓ Saved '{name}.parquet'")
+
+print("\n" + "="*60)
+print("CONVERSION COMPLETE!")
+print("="*60)
@@ -5,7 +5,10 @@ This script uses the trained XGBoost model to generate predictions for the submi
 
 import pandas as pd
 import numpy as np
+import xgboost as xgb
 import pickle
+import os
+from concurrent.futures import ThreadPoolExecutor
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -18,7 +21,21 @@ print("\nLoading trained model...")
 with open('m5_xgboost_model.pkl', 'rb') as f:
     model = pickle.load(f)
 
-print("Model loaded successfully!")
+# Predict through the raw booster, skipping the sklearn wrapper's input
+# validation (the training script saves a Booster; older pickles hold an
+# XGBRegressor)
+booster = model if isinstance(model, xgb.Booster) else model.get_booster()
+
+# Tree traversal device, e.g. XGB_DEVICE=cuda to score on the GPU. On the
+# GPU the features must be a device array as well, otherwise inplace_predict
+# falls back to building a DMatrix and copying it over on every call.
+device = os.environ.get('XGB_DEVICE', 'cpu')
+use_gpu = device.startswith('cuda')
+if use_gpu:
+    import cupy as cp
+booster.set_param({'device': device})
+
+print(f"Model loaded successfully! (device: {device})")
 
 # Load data
 print("\nLoading datasets...")
@@ -38,30 +55,31 @@ print("\n" + "="*60)
 print("PREPARING DATA FOR FORECASTING")
 print("="*60)
 
-id_cols = ['id', 'item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
 day_cols = [f'd_{i}' for i in range(1, 1914)]
+n_days = len(day_cols)
+horizon = 28
 
-# Transform to long format
-print("\nTransforming sales data...")
-sales_long = sales.melt(
-    id_vars=id_cols,
-    value_vars=day_cols,
-    var_name='d',
-    value_name='sales'
-)
-
-# Merge with calendar and prices
-sales_long = sales_long.merge(calendar, on='d', how='left')
-sales_long = sales_long.merge(
-    sell_prices, 
-    on=['store_id', 'item_id', 'wm_yr_wk'], 
-    how='left'
-)
+# Sales history plus room for the forecast horizon, one row per id.
+# Forecasts are written into it in place, so lag and rolling features
+# are plain column slices. Column-major, so each day's column is one
+# contiguous block rather than a stride across every row.
+print("\nBuilding sales matrix...")
+sales_matrix = np.zeros((len(sales), n_days + horizon), dtype=np.float32, order='F')
+sales_matrix[:, :n_days] = sales[day_cols].to_numpy(dtype=np.float32)
 
-sales_long['date'] = pd.to_datetime(sales_long['date'])
-sales_long = sales_long.sort_values(['id', 'date']).reset_index(drop=True)
+# Label encode categorical variables once
+categorical_cols = ['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
+static_codes = {col: sales[col].astype('category').cat.codes.to_numpy() for col in categorical_cols}
 
-print(f"Data prepared, shape: {sales_long.shape}")
+# Last known sell price, carried forward over the forecast horizon
+last_week = calendar.loc[calendar['d'] == day_cols[-1], 'wm_yr_wk'].iloc[0]
+last_prices = sales[['item_id', 'store_id']].merge(
+    sell_prices[sell_prices['wm_yr_wk'] == last_week],
+    on=['store_id', 'item_id'],
+    how='left'
+)['sell_price'].fillna(0).to_numpy()
+
+print(f"Data prepared, sales matrix shape: {sales_matrix.shape}")
 
 # ============================================================================
 # RECURSIVE FORECASTING (28 DAYS AHEAD)
@@ -71,137 +89,147 @@ print("\n" + "="*60)
 print("GENERATING 28-DAY FORECASTS")
 print("="*60)
 
-def create_features(df):
-    """Create all features for the model"""
-    
-    # Time-based features
-    df['day_of_week'] = df['wday']
-    df['day_of_month'] = df['date'].dt.day
-    df['week_of_year'] = df['date'].dt.isocalendar().week
-    df['month'] = df['month'].astype(np.int8)
-    df['year'] = df['year'].astype(np.int16)
-    
-    # Event features
-    df['has_event_1'] = (df['event_name_1'].notna()).astype(np.int8)
-    df['has_event_2'] = (df['event_name_2'].notna()).astype(np.int8)
-    
-    # SNAP features
-    df['snap_CA'] = df['snap_CA'].astype(np.int8)
-    df['snap_TX'] = df['snap_TX'].astype(np.int8)
-    df['snap_WI'] = df['snap_WI'].astype(np.int8)
+# Define feature columns
+feature_cols = [
+    'item_id', 'dept_id', 'cat_id', 'store_id', 'state_id',
+    'day_of_week', 'day_of_month', 'week_of_year', 'month', 'year',
+    'has_event_1', 'has_event_2',
+    'snap_CA', 'snap_TX', 'snap_WI',
+    'sell_price', 'price_change',
+    'lag_7', 'lag_14', 'lag_28',
+    'rolling_mean_7', 'rolling_mean_14', 'rolling_mean_28',
+    'rolling_std_7', 'rolling_std_14', 'rolling_std_28'
+]
+
+lag_days = [7, 14, 28]
+rolling_windows = [7, 14, 28]
+
+# Feature matrix of every id, allocated once and filled column by column.
+# Categorical codes and the carried-forward price never change, so they
+# are written a single time here.
+FEATURE_SLOTS = {name: i for i, name in enumerate(feature_cols)}
+X_pred = np.zeros((len(sales), len(feature_cols)), dtype=np.float32)
+for col, codes in static_codes.items():
+    X_pred[:, FEATURE_SLOTS[col]] = codes
+X_pred[:, FEATURE_SLOTS['sell_price']] = last_prices
+X_pred[:, FEATURE_SLOTS['price_change']] = 0.0
+if use_gpu:
+    # Device copy of X_pred, refreshed in place once per day
+    X_pred_gpu = cp.asarray(X_pred)
+
+# Running sum / sum of squares of the `window` days preceding the current
+# forecast day, updated incrementally instead of re-reducing each window
+running_sum = np.stack([
+    sales_matrix[:, n_days - w:n_days].sum(axis=1, dtype=np.float64) for w in rolling_windows
+], axis=1)
+running_sumsq = np.stack([
+    np.square(sales_matrix[:, n_days - w:n_days], dtype=np.float64).sum(axis=1) for w in rolling_windows
+], axis=1)
+
+# On the CPU, contiguous blocks of ids are featurized and scored in parallel
+# threads. They share sales_matrix and the running windows (numpy and XGBoost
+# release the GIL), and each booster call is single threaded to avoid
+# oversubscription. The GPU scores every id in one call instead.
+if not use_gpu:
+    n_jobs = os.cpu_count() or 1
+    shard_bounds = np.linspace(0, len(sales), n_jobs + 1).astype(int)
+    shards = [slice(start, end) for start, end in zip(shard_bounds[:-1], shard_bounds[1:]) if end > start]
+    booster.set_param({'nthread': 1})
+
+def fill_features(rows, day_features, cur):
+    """Write the features of the ids in `rows` for matrix column `cur` into X_pred"""
+    X = X_pred[rows]
     
-    # Price features
-    df['sell_price'] = df['sell_price'].fillna(0)
-    df['price_change'] = df.groupby('id')['sell_price'].transform(lambda x: x.diff())
-    df['price_change'] = df['price_change'].fillna(0)
+    # Calendar features (scalars broadcast to every id)
+    for col, value in day_features.items():
+        X[:, FEATURE_SLOTS[col]] = value
     
     # Lag features
-    for lag in [7, 14, 28]:
-        df[f'lag_{lag}'] = df.groupby('id')['sales'].shift(lag)
+    for lag in lag_days:
+        X[:, FEATURE_SLOTS[f'lag_{lag}']] = sales_matrix[rows, cur - lag]
     
-    # Rolling features
-    for window in [7, 14, 28]:
-        df[f'rolling_mean_{window}'] = (
-            df.groupby('id')['sales']
-            .transform(lambda x: x.shift(1).rolling(window).mean())
-        )
-        df[f'rolling_std_{window}'] = (
-            df.groupby('id')['sales']
-            .transform(lambda x: x.shift(1).rolling(window).std())
-        )
+    # Rolling features over the days preceding the forecast day (std uses
+    # ddof=1 like pandas rolling; clipped against rounding below zero)
+    for i, window in enumerate(rolling_windows):
+        mean = running_sum[rows, i] / window
+        var = (running_sumsq[rows, i] - running_sum[rows, i] * mean) / (window - 1)
+        X[:, FEATURE_SLOTS[f'rolling_mean_{window}']] = mean
+        X[:, FEATURE_SLOTS[f'rolling_std_{window}']] = np.sqrt(np.maximum(var, 0))
     
-    # Label encode categorical variables
-    categorical_cols = ['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
-    for col in categorical_cols:
-        df[col] = df[col].astype('category').cat.codes
-    
-    return df
+    # Missing values become 0, as in the original feature frame
+    np.nan_to_num(X, copy=False)
+    return X
 
-# Get calendar for future dates
-future_calendar = calendar[calendar['d'].isin([f'd_{i}' for i in range(1914, 1942)])].copy()
+def predict_shard(rows, day_features, cur):
+    """Featurize and score the ids in `rows` for matrix column `cur`"""
+    X = fill_features(rows, day_features, cur)
+    
+    # Score the shard in one call, without building a DMatrix, and feed the
+    # (non-negative) predictions back for the next day
+    predictions = booster.inplace_predict(X)
+    sales_matrix[rows, cur] = np.maximum(predictions, 0)
 
-# Store predictions
-all_predictions = {}
+executor = None if use_gpu else ThreadPoolExecutor(max_workers=len(shards))
 
-# Get unique item-store combinations
-unique_ids = sales['id'].unique()
+# Calendar features of the forecast days, looked up once into a
+# (horizon, n_features) table instead of filtering the calendar every day
+future_days = [f'd_{n_days + i}' for i in range(1, horizon + 1)]
+future_calendar = calendar.set_index('d').reindex(future_days)
+future_dates = pd.to_datetime(future_calendar['date'])
 
-print(f"\nForecasting for {len(unique_ids):,} unique time series...")
+calendar_feature_cols = [
+    'day_of_week', 'day_of_month', 'week_of_year', 'month', 'year',
+    'has_event_1', 'has_event_2', 'snap_CA', 'snap_TX', 'snap_WI'
+]
+cal28_feats = pd.DataFrame({
+    'day_of_week': future_calendar['wday'],
+    'day_of_month': future_dates.dt.day,
+    'week_of_year': future_dates.dt.isocalendar().week.astype(float),
+    'month': future_calendar['month'],
+    'year': future_calendar['year'],
+    'has_event_1': future_calendar['event_name_1'].notna(),
+    'has_event_2': future_calendar['event_name_2'].notna(),
+    'snap_CA': future_calendar['snap_CA'],
+    'snap_TX': future_calendar['snap_TX'],
+    'snap_WI': future_calendar['snap_WI'],
+}).to_numpy(dtype=np.float32)
 
-# Prepare base data for last known date
-base_data = sales_long.copy()
+print(f"\nForecasting for {len(sales):,} unique time series...")
 
 # Recursive forecasting for 28 days
-for day_ahead in range(1, 29):
+for day_ahead in range(1, horizon + 1):
     print(f"\nPredicting day {day_ahead}/28...")
     
-    # Get calendar info for this forecast day
-    d_col = f'd_{1913 + day_ahead}'
-    day_calendar = future_calendar[future_calendar['d'] == d_col].copy()
-    
-    if len(day_calendar) == 0:
-        print(f"  Warning: No calendar data for {d_col}")
-        continue
-    
-    # Create prediction dataset
-    pred_data_list = []
-    
-    for unique_id in unique_ids:
-        # Get last row for this id
-        item_data = base_data[base_data['id'] == unique_id].tail(1).copy()
-        
-        if len(item_data) == 0:
-            continue
-        
-        # Update date information from calendar
-        item_data['d'] = d_col
-        item_data['date'] = pd.to_datetime(day_calendar.iloc[0]['date'])
-        item_data['wm_yr_wk'] = day_calendar.iloc[0]['wm_yr_wk']
-        item_data['weekday'] = day_calendar.iloc[0]['weekday']
-        item_data['wday'] = day_calendar.iloc[0]['wday']
-        item_data['month'] = day_calendar.iloc[0]['month']
-        item_data['year'] = day_calendar.iloc[0]['year']
-        item_data['event_name_1'] = day_calendar.iloc[0]['event_name_1']
-        item_data['event_type_1'] = day_calendar.iloc[0]['event_type_1']
-        item_data['event_name_2'] = day_calendar.iloc[0]['event_name_2']
-        item_data['event_type_2'] = day_calendar.iloc[0]['event_type_2']
-        item_data['snap_CA'] = day_calendar.iloc[0]['snap_CA']
-        item_data['snap_TX'] = day_calendar.iloc[0]['snap_TX']
-        item_data['snap_WI'] = day_calendar.iloc[0]['snap_WI']
-        
-        pred_data_list.append(item_data)
+    # Matrix column of the day being forecast
+    cur = n_days + day_ahead - 1
     
-    pred_data = pd.concat(pred_data_list, ignore_index=True)
+    # Slide the running windows forward by the previous day
+    if day_ahead > 1:
+        entering = sales_matrix[:, cur - 1].astype(np.float64)
+        for i, window in enumerate(rolling_windows):
+            leaving = sales_matrix[:, cur - 1 - window]
+            running_sum[:, i] += entering - leaving
+            running_sumsq[:, i] += np.square(entering) - np.square(leaving, dtype=np.float64)
     
-    # Prepare features
-    pred_data = create_features(pred_data)
-    
-    # Define feature columns
-    feature_cols = [
-        'item_id', 'dept_id', 'cat_id', 'store_id', 'state_id',
-        'day_of_week', 'day_of_month', 'week_of_year', 'month', 'year',
-        'has_event_1', 'has_event_2',
-        'snap_CA', 'snap_TX', 'snap_WI',
-        'sell_price', 'price_change',
-        'lag_7', 'lag_14', 'lag_28',
-        'rolling_mean_7', 'rolling_mean_14', 'rolling_mean_28',
-        'rolling_std_7', 'rolling_std_14', 'rolling_std_28'
-    ]
-    
-    # Fill any remaining NaN values
-    X_pred = pred_data[feature_cols].fillna(0)
-    
-    # Make predictions
-    predictions = model.predict(X_pred)
-    predictions = np.maximum(predictions, 0)  # Ensure non-negative
+    # Get calendar info for this forecast day
+    if pd.isna(future_dates.iat[day_ahead - 1]):
+        print(f"  Warning: No calendar data for {future_days[day_ahead - 1]}")
+        continue
     
-    # Store predictions
-    pred_data['sales'] = predictions
-    all_predictions[f'F{day_ahead}'] = dict(zip(pred_data['id'], predictions))
+    day_features = dict(zip(calendar_feature_cols, cal28_feats[day_ahead - 1]))
     
-    # Append to base_data for next iteration
-    base_data = pd.concat([base_data, pred_data], ignore_index=True)
-    base_data = base_data.sort_values(['id', 'date']).reset_index(drop=True)
+    if use_gpu:
+        # One host-to-device copy and a single call scoring every id
+        fill_features(slice(None), day_features, cur)
+        X_pred_gpu.set(X_pred)
+        predictions = booster.inplace_predict(X_pred_gpu).get()
+        sales_matrix[:, cur] = np.maximum(predictions, 0)
+    else:
+        # Every shard must finish before day + 1 reads this day's predictions
+        list(executor.map(lambda rows: predict_shard(rows, day_features, cur), shards))
+
+if executor is not None:
+    executor.shutdown()
 
 print("\n" + "="*60)
 print("CREATING SUBMISSION FILE")
@@ -210,11 +238,11 @@ print("="*60)
 # Create submission dataframe
 submission = sample_submission.copy()
 
-# Fill predictions
-for day in range(1, 29):
-    f_col = f'F{day}'
-    if f_col in all_predictions:
-        submission[f_col] = submission['id'].map(all_predictions[f_col])
+# Fill all forecast columns with one id lookup; the forecasts are the last
+# `horizon` columns of the sales matrix
+f_cols = [f'F{day}' for day in range(1, horizon + 1)]
+pred_df = pd.DataFrame(sales_matrix[:, n_days:], index=sales['id'], columns=f_cols)
+submission[f_cols] = pred_df.reindex(submission['id']).to_numpy()
 
 # Fill any missing values with 0
 submission = submission.fillna(0)
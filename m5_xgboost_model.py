@@ -5,12 +5,49 @@ This script builds a machine learning model to forecast Walmart sales using XGBo
 
 import pandas as pd
 import numpy as np
-from xgboost import XGBRegressor
+import xgboost as xgb
 from sklearn.metrics import mean_squared_error, mean_absolute_error
+from numba import njit, prange
 import gc
 import warnings
 warnings.filterwarnings('ignore')
 
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+@njit(parallel=True)
+def rolling_feats(sales, offsets, windows, out_mean, out_std):
+    """Rolling mean/std (ddof=1) of the `w` days before each row, per id
+    
+    Equivalent to groupby('id')['sales'].transform(lambda x: x.shift(1).rolling(w))
+    on id-sorted rows: one pass per id with a running sum and sum of
+    squares, ids processed in parallel. Rows without a full window are NaN.
+    """
+    for g in prange(len(offsets) - 1):
+        start = offsets[g]
+        end = offsets[g + 1]
+        for j in range(len(windows)):
+            w = windows[j]
+            total = 0.0
+            sq_total = 0.0
+            for i in range(start, end):
+                if i - start >= w:
+                    mean = total / w
+                    out_mean[i, j] = mean
+                    out_std[i, j] = np.sqrt(max((sq_total - total * mean) / (w - 1), 0.0))
+                else:
+                    out_mean[i, j] = np.nan
+                    out_std[i, j] = np.nan
+                
+                # Slide the window to end at row i for the next row
+                total += sales[i]
+                sq_total += sales[i] * sales[i]
+                if i - start >= w:
+                    total -= sales[i - w]
+                    sq_total -= sales[i - w] * sales[i - w]
+
 print("Loading datasets...")
 
 # Load data
@@ -22,6 +59,11 @@ print(f"Sales shape: {sales.shape}")
 print(f"Calendar shape: {calendar.shape}")
 print(f"Prices shape: {sell_prices.shape}")
 
+# Category levels from the full product list, so the codes the model sees
+# match the sorted label encoding used by the API and prediction script
+categorical_cols = ['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
+category_levels = {col: sorted(sales[col].unique()) for col in categorical_cols}
+
 # Sample products to reduce memory usage
 print("\nSampling products to reduce memory usage...")
 np.random.seed(42)
@@ -48,11 +90,41 @@ sales_long = sales.melt(
     value_name='sales'
 )
 
+# Downcast before merging: unit sales fit in int16 and the 'd_<n>' strings
+# become an int32 day index, so every downstream groupby moves fewer bytes
+sales_long['sales'] = sales_long['sales'].astype(np.int16)
+sales_long['d_idx'] = sales_long['d'].str.slice(2).astype(np.int32)
+sales_long = sales_long.drop(columns='d')
+
 print(f"Long format shape: {sales_long.shape}")
 
+# Prepare the calendar once (1969 rows) instead of on the merged frame
+calendar['d_idx'] = calendar['d'].str.slice(2).astype(np.int32)
+calendar = calendar.drop(columns='d')
+calendar['date'] = pd.to_datetime(calendar['date'])
+calendar_str_cols = ['weekday', 'event_name_1', 'event_type_1', 'event_name_2', 'event_type_2']
+calendar[calendar_str_cols] = calendar[calendar_str_cols].astype('category')
+
+# Create time-based features
+print("Creating time-based features...")
+calendar['day_of_week'] = calendar['wday'].astype(np.int8)
+calendar['day_of_month'] = calendar['date'].dt.day.astype(np.int8)
+calendar['week_of_year'] = calendar['date'].dt.isocalendar().week.astype(np.int8)
+calendar['month'] = calendar['month'].astype(np.int8)
+calendar['year'] = calendar['year'].astype(np.int16)
+
+# Create event features
+calendar['has_event_1'] = (calendar['event_name_1'].notna()).astype(np.int8)
+calendar['has_event_2'] = (calendar['event_name_2'].notna()).astype(np.int8)
+
+# SNAP benefits features
+calendar['snap_CA'] = calendar['snap_CA'].astype(np.int8)
+calendar['snap_TX'] = calendar['snap_TX'].astype(np.int8)
+calendar['snap_WI'] = calendar['snap_WI'].astype(np.int8)
+
 # Merge with calendar
 print("Merging with calendar data...")
-sales_long = sales_long.merge(calendar, on='d', how='left')
+sales_long = sales_long.merge(calendar, on='d_idx', how='left')
 
 # Merge with prices
 print("Merging with price data...")
@@ -62,26 +134,6 @@ sales_long = sales_long.merge(
     how='left'
 )
 
-# Convert date to datetime
-sales_long['date'] = pd.to_datetime(sales_long['date'])
-
-# Create time-based features
-print("Creating time-based features...")
-sales_long['day_of_week'] = sales_long['wday']
-sales_long['day_of_month'] = sales_long['date'].dt.day
-sales_long['week_of_year'] = sales_long['date'].dt.isocalendar().week
-sales_long['month'] = sales_long['month'].astype(np.int8)
-sales_long['year'] = sales_long['year'].astype(np.int16)
-
-# Create event features
-sales_long['has_event_1'] = (sales_long['event_name_1'].notna()).astype(np.int8)
-sales_long['has_event_2'] = (sales_long['event_name_2'].notna()).astype(np.int8)
-
-# SNAP benefits features
-sales_long['snap_CA'] = sales_long['snap_CA'].astype(np.int8)
-sales_long['snap_TX'] = sales_long['snap_TX'].astype(np.int8)
-sales_long['snap_WI'] = sales_long['snap_WI'].astype(np.int8)
-
 # Fill missing prices with 0 (items not yet available)
 sales_long['sell_price'] = sales_long['sell_price'].fillna(0)
 
@@ -89,41 +141,76 @@ print("\nCreating lag features...")
 # Sort by item and date for proper lag calculation
 sales_long = sales_long.sort_values(['id', 'date']).reset_index(drop=True)
 
-# Create lag features (previous days sales)
-lag_days = [7, 14, 28]
-for lag in lag_days:
-    print(f"  Creating lag_{lag}...")
-    sales_long[f'lag_{lag}'] = sales_long.groupby('id')['sales'].shift(lag)
+# Categorical id (codes instead of string hashing) and a single GroupBy
+# reused by every per-id operation below
+sales_long['id'] = sales_long['id'].astype('category')
+id_groups = sales_long.groupby('id', sort=False, observed=True)
+id_codes = sales_long['id'].cat.codes.to_numpy()
 
-print("\nCreating rolling window features...")
-# Create rolling mean features
+lag_days = [7, 14, 28]
 rolling_windows = [7, 14, 28]
-for window in rolling_windows:
-    print(f"  Creating rolling_mean_{window}...")
-    sales_long[f'rolling_mean_{window}'] = (
-        sales_long.groupby('id')['sales']
-        .transform(lambda x: x.shift(1).rolling(window).mean())
+
+if pl is not None:
+    # Polars computes every lag and rolling window per id natively in one
+    # select; only the id codes and sales are handed over
+    print("  Creating lag and rolling window features with polars...")
+    sales_f = pl.col('sales').cast(pl.Float64)
+    shifted = sales_f.shift(1)
+    window_feats = pl.DataFrame({
+        'id': id_codes,
+        'sales': sales_long['sales'].to_numpy()
+    }).select(
+        [sales_f.shift(lag).over('id').alias(f'lag_{lag}') for lag in lag_days] +
+        [shifted.rolling_mean(w).over('id').alias(f'rolling_mean_{w}') for w in rolling_windows] +
+        [shifted.rolling_std(w).over('id').alias(f'rolling_std_{w}') for w in rolling_windows]
     )
+    sales_long[window_feats.columns] = window_feats.to_numpy()
+    del window_feats
+else:
+    # Create lag features (previous days sales)
+    for lag in lag_days:
+        print(f"  Creating lag_{lag}...")
+        sales_long[f'lag_{lag}'] = id_groups['sales'].shift(lag)
     
-    print(f"  Creating rolling_std_{window}...")
-    sales_long[f'rolling_std_{window}'] = (
-        sales_long.groupby('id')['sales']
-        .transform(lambda x: x.shift(1).rolling(window).std())
+    print("\nCreating rolling window features...")
+    # Rows are sorted by id, so each id is one contiguous block of the sales
+    # array; offsets[g]:offsets[g + 1] is the block of the g-th id
+    offsets = np.searchsorted(id_codes, np.arange(id_codes.max() + 2))
+    
+    rolling_mean = np.empty((len(sales_long), len(rolling_windows)))
+    rolling_std = np.empty((len(sales_long), len(rolling_windows)))
+    rolling_feats(
+        sales_long['sales'].to_numpy(dtype=np.float64),
+        offsets,
+        np.array(rolling_windows),
+        rolling_mean,
+        rolling_std
     )
+    
+    sales_long[[f'rolling_mean_{w}' for w in rolling_windows]] = rolling_mean
+    sales_long[[f'rolling_std_{w}' for w in rolling_windows]] = rolling_std
+    del rolling_mean, rolling_std
 
 # Price features
 print("\nCreating price features...")
-sales_long['price_change'] = (
-    sales_long.groupby('id')['sell_price']
-    .transform(lambda x: x.diff())
-)
-sales_long['price_change'] = sales_long['price_change'].fillna(0)
+sales_long['price_change'] = id_groups['sell_price'].diff().fillna(0)
+
+# The GroupBy holds a reference to sales_long; release it so the frame can
+# be freed before training
+del id_groups, id_codes
 
-# Label encode categorical variables
+# Categorical columns stay pandas Categoricals; XGBoost splits on them natively
 print("\nEncoding categorical variables...")
-categorical_cols = ['item_id', 'dept_id', 'cat_id', 'store_id', 'state_id']
 for col in categorical_cols:
-    sales_long[col] = sales_long[col].astype('category').cat.codes
+    sales_long[col] = pd.Categorical(sales_long[col], categories=category_levels[col])
+
+# Continuous features as float32 (calendar features are already int8/int16),
+# halving the bytes XGBoost scans while binning the training matrices
+float_cols = ['sell_price', 'price_change'] + \
+    [f'lag_{lag}' for lag in lag_days] + \
+    [f'rolling_mean_{w}' for w in rolling_windows] + \
+    [f'rolling_std_{w}' for w in rolling_windows]
+sales_long[float_cols] = sales_long[float_cols].astype(np.float32)
 
 # ============================================================================
 # TRAIN/VALIDATION SPLIT
@@ -181,29 +268,40 @@ print("\n" + "="*60)
 print("TRAINING XGBOOST MODEL")
 print("="*60)
 
-# Initialize XGBoost model
-model = XGBRegressor(
-    n_estimators=1000,
-    learning_rate=0.1,
-    max_depth=8,
-    min_child_weight=1,
-    subsample=0.8,
-    colsample_bytree=0.8,
-    gamma=0,
-    reg_alpha=0.1,
-    reg_lambda=1,
-    random_state=42,
-    n_jobs=-1,
-    tree_method='hist'  # Faster training
-)
-
+# XGBoost parameters
+params = {
+    'objective': 'reg:squarederror',
+    'learning_rate': 0.1,
+    'max_depth': 8,
+    'min_child_weight': 1,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'gamma': 0,
+    'reg_alpha': 0.1,
+    'reg_lambda': 1,
+    'seed': 42,
+    'tree_method': 'hist'  # Faster training
+}
+
+# Pre-binned matrices built straight from the categorical frame, so there
+# is no separate DMatrix copy of the training data
+print("\nBuilding training matrices...")
+dtrain = xgb.QuantileDMatrix(X_train, y_train, enable_categorical=True)
+dval = xgb.QuantileDMatrix(X_val, y_val, ref=dtrain, enable_categorical=True)
+
+# Stop once validation RMSE hasn't improved for 50 rounds; save_best trims
+# the returned booster to the best iteration, so later predict calls
+# (here, in the API and in generate_predictions) need no iteration_range
 print("\nFitting model...")
-model.fit(
-    X_train, 
-    y_train,
-    eval_set=[(X_val, y_val)],
-    verbose=50
+model = xgb.train(
+    params,
+    dtrain,
+    num_boost_round=1000,
+    evals=[(dval, 'validation')],
+    callbacks=[xgb.callback.EarlyStopping(rounds=50, save_best=True)],
+    verbose_eval=50
 )
+print(f"Best iteration: {model.best_iteration}")
 
 # ============================================================================
 # MODEL EVALUATION
@@ -215,8 +313,8 @@ print("="*60)
 
 # Make predictions
 print("\nMaking predictions on validation set...")
-y_pred_train = model.predict(X_train)
-y_pred_val = model.predict(X_val)
+y_pred_train = model.inplace_predict(X_train)
+y_pred_val = model.inplace_predict(X_val)
 
 # Calculate metrics
 train_rmse = np.sqrt(mean_squared_error(y_train, y_pred_train))
@@ -235,9 +333,13 @@ print("\n" + "="*60)
 print("TOP 20 FEATURE IMPORTANCES")
 print("="*60)
 
+# Normalized average gain per split, as reported by the sklearn wrapper
+gain = model.get_score(importance_type='gain')
+importance = np.array([gain.get(col, 0.0) for col in feature_cols])
+
 feature_importance = pd.DataFrame({
     'feature': feature_cols,
-    'importance': model.feature_importances_
+    'importance': importance / importance.sum()
 }).sort_values('importance', ascending=False)
 
 print(feature_importance.head(20).to_string(index=False))
@@ -267,6 +369,7 @@ print("="*60)
 print(f"""
 Summary:
 - Features: {len(feature_cols)}
+- Boosting rounds: {model.num_boosted_rounds()}
 - Training samples: {len(X_train):,}
 - Validation samples: {len(X_val):,}
 - Validation RMSE: {val_rmse:.4f}